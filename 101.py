@@ -9,22 +9,210 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from nsepython import nsefetch
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from curl_cffi import requests as cffi_requests
 import plotly.graph_objects as go
 
 # ─────────────────────────
 #  USER CONFIGURABLE LIST
 # ─────────────────────────
-STOCKS = [
+STOCKS: tuple[str, ...] = (
     "RELIANCE", "TCS", "INFY", "HDFCBANK", "ICICIBANK", "SBIN",
     "HINDUNILVR", "BHARTIARTL", "AXISBANK", "KOTAKBANK", "WIPRO",
     "LT", "ASIANPAINT", "ITC", "MARUTI"
-]
+)
+LIVE_BUF_LEN = 300   # live‑graph points kept per symbol (~15 min @ 3 s)
+MAX_SYMBOLS_TRACKED = 64   # LRU cap on symbols with a live buffer
+
+# ─────────────────────────
+#  LIVE GRAPH STYLE
+# ─────────────────────────
+UP_COLOR_LINE    = "lime"
+DN_COLOR_LINE    = "red"
+UP_COLOR_AREA    = "rgba(0,255,0,0.20)"
+DN_COLOR_AREA    = "rgba(255,0,0,0.20)"
+CRASH_COLOR_AREA = "rgba(255,0,0,0.35)"
+
+UP_LINE    = dict(color=UP_COLOR_LINE, width=2)
+DN_LINE    = dict(color=DN_COLOR_LINE, width=2)
+DOT_MARKER = dict(size=8, color="white")
+
+LIVE_LAYOUT = dict(
+    plot_bgcolor="#1e1e1e",
+    paper_bgcolor="#1e1e1e",
+    font=dict(color="white"),
+    hovermode="x unified",
+    dragmode="zoom",
+    xaxis_title="Time (IST)",
+    yaxis_title="Price (₹)"
+)
+
+# ─────────────────────────
+#  NSE FETCH HELPERS
+# ─────────────────────────
+# User-Agent comes from the Chrome impersonation so it matches the TLS handshake.
+NSE_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.nseindia.com/",
+}
+
+
+# One shared session per server process so NSE cookies are reused across
+# calls. It impersonates Chrome's TLS fingerprint (as nsepython does) – NSE's
+# bot manager blocks plain `requests` on the handshake alone. curl_cffi keeps
+# one curl handle (and so one set of open connections) per thread; see
+# fetch_pool() for how those are kept alive between batches.
+@st.cache_resource
+def nse_session() -> cffi_requests.Session:
+    s = cffi_requests.Session(impersonate="chrome")
+    s.headers.update(NSE_HEADERS)
+    r = s.get("https://www.nseindia.com", timeout=5)   # prime cookies
+    r.raise_for_status()    # don't cache a cookie-less session
+    return s
+
+
+# Long‑lived 16‑thread pool for the whole process. Reusing the same threads
+# is what lets each thread's curl handle keep its TLS connection open to NSE
+# from one 30 s batch to the next.
+@st.cache_resource
+def fetch_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix="nse")
+
+
+@st.cache_resource
+def _reprime_guard() -> dict:
+    return {"lock": threading.Lock(), "stale": None, "fresh": None}
+
+
+def _reprimed_session(stale: cffi_requests.Session) -> cffi_requests.Session:
+    """Replace a rejected session; only the first worker to see it re‑primes."""
+    g = _reprime_guard()
+    with g["lock"]:
+        if g["stale"] is not stale:
+            g["stale"] = stale
+            nse_session.clear()
+            try:
+                g["fresh"] = nse_session()
+            except Exception as e:      # homepage down – don't retry per worker
+                g["fresh"] = e
+        fresh = g["fresh"]
+    if isinstance(fresh, Exception):
+        raise fresh
+    return fresh
+
+
+_QUOTE_URL = "https://www.nseindia.com/api/quote-equity?symbol={}".format
+
+
+def _get_quote(symbol: str) -> dict:
+    s = nse_session()
+    r = s.get(_QUOTE_URL(symbol), timeout=5)
+    if r.status_code in (401, 403):
+        # cookies expired/rejected – re-prime (once per session) and retry
+        r = _reprimed_session(s).get(_QUOTE_URL(symbol), timeout=5)
+    r.raise_for_status()
+    return orjson.loads(r.content)   # faster than r.json() on ~10–30 KB bodies
+
+
+# Live graph needs fresher prices – short TTL so 🔄 Refresh still moves.
+@st.cache_data(ttl=3, show_spinner=False, max_entries=64)
+def fetch_live_quote(symbol: str) -> dict:
+    return _get_quote(symbol)
+
+
+_NO_COMMA = str.maketrans("", "", ",")
+
+
+def to_float(v) -> float:
+    """NSE mixes plain numbers and "1,234.50" strings – only parse the latter."""
+    if isinstance(v, (int, float)):
+        return float(v)
+    return float(str(v).translate(_NO_COMMA))
+
+
+class NoQuotes(RuntimeError):
+    """No symbol in a batch could be fetched."""
+
+
+# Every widget interaction reruns the script; one cached batch keyed on the
+# symbol tuple serves both the Predictions and Daily tabs.
+@st.cache_data(ttl=30, show_spinner="Fetching NSE quotes…", max_entries=16)
+def fetch_all_quotes(symbols: tuple[str, ...]) -> dict[str, dict | None]:
+    """Fetch all symbols concurrently -> {symbol: quote}; None on failure.
+
+    Raises if every symbol failed so cache_data doesn't pin an outage.
+    """
+    def _one(symbol):
+        try:
+            return _get_quote(symbol)
+        except Exception:
+            return None
+
+    # prime here, on the script thread, so a dead homepage costs one timeout
+    # instead of one per worker queued behind the cache_resource computation
+    try:
+        nse_session()
+    except Exception as e:
+        raise NoQuotes(f"could not open an NSE session: {e}") from e
+
+    quotes = dict(zip(symbols, fetch_pool().map(_one, symbols)))
+    if not any(quotes.values()):
+        raise NoQuotes("NSE returned no quotes")
+    return quotes
+
+
+# ─────────────────────────
+#  LIVE PRICE BUFFER
+# ─────────────────────────
+# Timestamps and prices live in two preallocated rings sharing one head
+# index, so min/max run in NumPy and the plot takes the arrays as‑is.
+def new_price_buf() -> dict:
+    return {
+        "times":  np.empty(LIVE_BUF_LEN, dtype="datetime64[ns]"),
+        "prices": np.empty(LIVE_BUF_LEN, dtype=np.float64),
+        "head":   0,    # next write slot
+        "n":      0,    # filled slots
+    }
+
+
+def push_price(buf: dict, ts: datetime, price: float) -> None:
+    head = buf["head"]
+    buf["times"][head]  = ts
+    buf["prices"][head] = price
+    buf["head"] = (head + 1) % LIVE_BUF_LEN
+    buf["n"] = min(buf["n"] + 1, LIVE_BUF_LEN)
+
+
+def ordered(buf: dict, key: str) -> np.ndarray:
+    """buf[key] oldest → newest; a view until the ring wraps."""
+    arr, head, n = buf[key], buf["head"], buf["n"]
+    if n < LIVE_BUF_LEN:
+        return arr[:n]
+    return np.concatenate((arr[head:], arr[:head]))
+
 
 # Session‑level storage for live‑price buffers
 if "price_buf" not in st.session_state:
-    st.session_state.price_buf = {}   # {symbol: [(timestamp, price), ...]}
+    st.session_state.price_buf = OrderedDict()   # {symbol: new_price_buf()}, LRU order
+
+
+def get_price_buf(symbol: str) -> dict:
+    """Symbol's live buffer, marked most‑recently used; evicts the stalest."""
+    bufs = st.session_state.price_buf
+    buf = bufs.get(symbol)
+    if buf is None:
+        buf = bufs[symbol] = new_price_buf()
+        while len(bufs) > MAX_SYMBOLS_TRACKED:
+            bufs.popitem(last=False)
+    else:
+        bufs.move_to_end(symbol)
+    return buf
 
 # ─────────────────────────
 #  PAGE SETUP
@@ -32,6 +220,15 @@ if "price_buf" not in st.session_state:
 st.set_page_config(page_title="📈 Modern Stock Analyzer", layout="wide")
 st.title("📈 Modern Stock Analyzer – NSE")
 
+try:
+    quotes = fetch_all_quotes(STOCKS)
+except NoQuotes:
+    quotes = dict.fromkeys(STOCKS)
+
+failed = [s for s, q in quotes.items() if q is None]
+if failed:
+    st.warning(f"⚠️ Could not fetch NSE data for: {', '.join(failed)}")
+
 tabs = st.tabs(["📊 Predictions", "📡 Live Graph", "📅 Daily Performance"])
 
 # ==========================================================
@@ -40,31 +237,32 @@ tabs = st.tabs(["📊 Predictions", "📡 Live Graph", "📅 Daily Performance"]
 with tabs[0]:
     st.subheader("Weekly Prediction (High vs Low Range)")
 
-    rows = []
-    for s in STOCKS:
+    # build column-wise; failed symbols are simply left out
+    syms, pcts = [], []
+    for s, q in quotes.items():
         try:
-            q = nsefetch(f"https://www.nseindia.com/api/quote-equity?symbol={s}")
             week = q["priceInfo"]["weekHighLow"]
 
             # NSE API now returns min/max
-            low  = float(str(week["min"]).replace(",", ""))
-            high = float(str(week["max"]).replace(",", ""))
+            low  = to_float(week["min"])
+            high = to_float(week["max"])
 
             pct = ((high - low) / low) * 100 if low else 0.0
-            sig = "✅ Buy" if pct > 2 else ("👀 Watch" if pct > 0 else "❌ Avoid")
-
-            rows.append({"Stock": s, "Weekly %": f"{pct:+.2f}%", "Suggestion": sig})
         except Exception:
-            rows.append({"Stock": s, "Weekly %": "Error", "Suggestion": "N/A"})
-
-    df = pd.DataFrame(rows)
-    df = df[df["Weekly %"].str.contains("%")]
-    df = df.sort_values(
-        by="Weekly %",
-        ascending=False,
-        key=lambda c: c.str.replace("%", "").astype(float),
-        ignore_index=True
-    )
+            continue
+        syms.append(s)
+        pcts.append(pct)
+
+    pct_arr = np.asarray(pcts, dtype=np.float32)
+    df = pd.DataFrame({
+        "Stock":      syms,
+        "Weekly %":   pct_arr,
+        "Suggestion": np.select([pct_arr > 2, pct_arr > 0], ["✅ Buy", "👀 Watch"], "❌ Avoid"),
+    })
+    # sort numerically, then format for display only
+    df.sort_values("Weekly %", ascending=False, kind="mergesort",
+                   ignore_index=True, inplace=True)
+    df["Weekly %"] = df["Weekly %"].map("{:+.2f}%".format)
 
     st.dataframe(df, use_container_width=True)
     top3 = ", ".join(df.head(3)["Stock"].tolist())
@@ -80,75 +278,75 @@ with tabs[1]:
 
     # manual refresh button
     refresh_clicked = st.button("🔄 Refresh Price", key="refresh_btn")
+    chart_slot = st.empty()
 
     # Only plot when user presses refresh or first time load
     if refresh_clicked or selected not in st.session_state.price_buf:
         try:
-            q = nsefetch(f"https://www.nseindia.com/api/quote-equity?symbol={selected}")
-            price      = float(q["priceInfo"]["lastPrice"])
-            prev_close = float(q["priceInfo"]["previousClose"])
+            q = fetch_live_quote(selected)
+            price      = to_float(q["priceInfo"]["lastPrice"])
+            prev_close = to_float(q["priceInfo"]["previousClose"])
             now        = datetime.now()
 
             # update buffer
-            buf = st.session_state.price_buf.setdefault(selected, [])
-            buf.append((now, price))
-            buf[:] = buf[-300:]          # keep last 300 points (~15 min @ 3 s)
+            buf = get_price_buf(selected)
+            push_price(buf, now, price)
 
-            times, prices = zip(*buf)
+            times  = ordered(buf, "times")
+            prices = ordered(buf, "prices")
             uptrend = prices[-1] >= prices[0]
-            line_color  = "lime" if uptrend else "red"
-            area_color  = "rgba(0,255,0,0.20)" if uptrend else "rgba(255,0,0,0.20)"
+            line_style = UP_LINE if uptrend else DN_LINE
+            area_color = UP_COLOR_AREA if uptrend else DN_COLOR_AREA
             # crash detection: >3 % drop from max in buffer
-            crash = prices[-1] < max(prices) * 0.97
+            crash = prices[-1] < prices.max() * 0.97
             if crash:
-                line_color = "red"
-                area_color = "rgba(255,0,0,0.35)"
-
-            # Build figure
-            fig = go.Figure()
-
-            fig.add_trace(go.Scatter(
+                line_style = DN_LINE
+                area_color = CRASH_COLOR_AREA
+
+            # Figure + static layout are built once per session; a refresh
+            # only patches trace data, colours and the prev-close line.
+            fig = st.session_state.get("live_fig")
+            if fig is None:
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(mode="lines", fill="tozeroy"))
+
+                # Dot + price label
+                fig.add_trace(go.Scatter(
+                    mode="markers+text",
+                    marker=DOT_MARKER,
+                    textposition="top center",
+                    showlegend=False
+                ))
+
+                # Previous close dashed
+                fig.add_hline(
+                    y=0,
+                    line_dash="dash",
+                    line_color="white",
+                    annotation_position="bottom right"
+                )
+
+                fig.update_layout(LIVE_LAYOUT)
+                st.session_state.live_fig = fig
+
+            line_trace, dot_trace = fig.data
+            line_trace.update(
                 x=times,
                 y=prices,
-                mode="lines",
-                line=dict(color=line_color, width=2),
-                fill="tozeroy",
+                line=line_style,
                 fillcolor=area_color,
                 name=selected
-            ))
-
-            # Dot + price label
-            fig.add_trace(go.Scatter(
+            )
+            dot_trace.update(
                 x=[times[-1]],
                 y=[prices[-1]],
-                mode="markers+text",
-                marker=dict(size=8, color="white"),
-                text=[f"₹{prices[-1]:.2f}"],
-                textposition="top center",
-                showlegend=False
-            ))
-
-            # Previous close dashed
-            fig.add_hline(
-                y=prev_close,
-                line_dash="dash",
-                line_color="white",
-                annotation_text=f"Prev ₹{prev_close:.2f}",
-                annotation_position="bottom right"
+                text=[f"₹{price:.2f}"]
             )
+            fig.layout.shapes[0].update(y0=prev_close, y1=prev_close)
+            fig.layout.annotations[0].update(y=prev_close, text=f"Prev ₹{prev_close:.2f}")
+            fig.layout.title.text = f"{selected} Live ₹{price:.2f} – {now.strftime('%d %b %Y')}"
 
-            fig.update_layout(
-                title=f"{selected} Live ₹{prices[-1]:.2f} – {now.strftime('%d %b %Y')}",
-                plot_bgcolor="#1e1e1e",
-                paper_bgcolor="#1e1e1e",
-                font=dict(color="white"),
-                hovermode="x unified",
-                dragmode="zoom",
-                xaxis_title="Time (IST)",
-                yaxis_title="Price (₹)"
-            )
-
-            st.plotly_chart(fig, use_container_width=True)
+            chart_slot.plotly_chart(fig, use_container_width=True)
 
         except Exception as e:
             st.error(f"Graph Error: {e}")
@@ -162,25 +360,33 @@ with tabs[1]:
 with tabs[2]:
     st.subheader("📅 Daily Performance")
 
-    perf_rows = []
-    for s in STOCKS:
+    syms, opens, closes = [], [], []
+    for s, q in quotes.items():
         try:
-            q = nsefetch(f"https://www.nseindia.com/api/quote-equity?symbol={s}")
             info = q["priceInfo"]
-            open_price  = float(info["open"])
-            close_price = float(info["lastPrice"])
-            net         = close_price - open_price
-            emoji       = "📈" if net > 0 else "📉"
-            perf_rows.append({
-                "Stock": s,
-                "Open":  f"₹{open_price:.2f}",
-                "Close": f"₹{close_price:.2f}",
-                "Net P/L": f"{emoji} ₹{net:+.2f}"
-            })
+            open_price  = to_float(info["open"])
+            close_price = to_float(info["lastPrice"])
         except Exception:
-            perf_rows.append({"Stock": s, "Open": "-", "Close": "-", "Net P/L": "N/A"})
-
-    st.dataframe(pd.DataFrame(perf_rows), use_container_width=True)
+            open_price = close_price = np.nan
+        syms.append(s)
+        opens.append(open_price)
+        closes.append(close_price)
+
+    # numeric columns first, then format/emoji in one vectorized pass
+    o   = pd.Series(opens, dtype="float64")
+    c   = pd.Series(closes, dtype="float64")
+    net = c - o
+    ok  = net.notna()
+    emoji = pd.Series(np.where(net > 0, "📈 ", "📉 "))
+
+    perf_df = pd.DataFrame({
+        "Stock":   syms,
+        "Open":    o.map("₹{:.2f}".format).where(ok, "-"),
+        "Close":   c.map("₹{:.2f}".format).where(ok, "-"),
+        "Net P/L": (emoji + net.map("₹{:+.2f}".format)).where(ok, "N/A"),
+    })
+
+    st.dataframe(perf_df, use_container_width=True)
 
 st.caption("success")
 